@@ -37,7 +37,7 @@ BGSAVE_STARTED = SimpleString(b"Background saving started")
 
 
 def current_time() -> int:
-    return int(time.time() * 1000)
+    return time.time_ns() // 1_000_000
 
 
 def null_terminate(s: bytes) -> bytes:
@@ -1,14 +1,19 @@
 import bisect
 import itertools
 import sys
-import time
 from collections import Counter
 from dataclasses import dataclass
 from operator import itemgetter
-from typing import List, Union, Tuple, Optional, NamedTuple, Dict, Any, Sequence, Generator
+from typing import List, Union, Tuple, Optional, NamedTuple, Dict, Any, Sequence, Iterator, Set
+
+import sortedcontainers
 
 from fakeredis._commands import BeforeAny, AfterAny
-from fakeredis._helpers import current_time
+from fakeredis._helpers import current_time, SimpleError
+from fakeredis._msgs import XADD_INVALID_ID
+
+# Above this many ids, XDEL rebuilds the key list once instead of deleting entries one by one
+_DELETE_REBUILD_THRESHOLD = 512
 
 
 class StreamEntryKey(NamedTuple):
@@ -16,15 +21,19 @@ class StreamEntryKey(NamedTuple):
     seq: int
 
     def encode(self) -> bytes:
-        return f"{self.ts}-{self.seq}".encode()
+        return b"%d-%d" % (self.ts, self.seq)
 
     @staticmethod
     def parse_str(entry_key_str: Union[bytes, str]) -> "StreamEntryKey":
-        if isinstance(entry_key_str, bytes):
-            entry_key_str = entry_key_str.decode()
-        s = entry_key_str.split("-")
-        (timestamp, sequence) = (int(s[0]), 0) if len(s) == 1 else (int(s[0]), int(s[1]))
-        return StreamEntryKey(timestamp, sequence)
+        if isinstance(entry_key_str, str):
+            entry_key_str = entry_key_str.encode()
+        timestamp, sep, sequence = entry_key_str.partition(b"-")
+        return StreamEntryKey(int(timestamp), int(sequence) if sep else 0)
+
+
+class StreamEntry(NamedTuple):
+    encoded_key: bytes
+    fields: List[bytes]
 
 
 class StreamRangeTest:
@@ -48,9 +57,12 @@ class StreamRangeTest:
             return cls(BeforeAny(), True)
         elif value == b"+":
             return cls(AfterAny(), True)
-        elif value[:1] == b"(":
-            return cls(StreamEntryKey.parse_str(value[1:]), True)
-        return cls(StreamEntryKey.parse_str(value), exclusive)
+        try:
+            if value.startswith(b"("):
+                return cls(StreamEntryKey.parse_str(value[1:]), True)
+            return cls(StreamEntryKey.parse_str(value), exclusive)
+        except ValueError:
+            raise SimpleError(XADD_INVALID_ID)
 
 
 @dataclass
@@ -97,8 +109,8 @@ class StreamGroup(object):
         self.last_delivered_key = start_key
         self.last_ack_key = start_key
         # Pending entry List, see https://redis.io/commands/xreadgroup/
-        # msg_id -> consumer_name, time read
-        self.pel: Dict[StreamEntryKey, Any] = dict()
+        # msg_id -> consumer_name, time read. Sorted by msg_id
+        self.pel = sortedcontainers.SortedDict()
 
     def set_id(self, last_delivered_str: bytes, entries_read: Optional[int]) -> None:
         """Set last_delivered_id for the group"""
@@ -121,16 +133,19 @@ class StreamGroup(object):
         return res
 
     def consumers_info(self) -> List[List[Union[bytes, int]]]:
-        return [self.consumers[k].info(current_time()) for k in self.consumers]
+        curr_time = current_time()
+        return [consumer.info(curr_time) for consumer in self.consumers.values()]
 
     def group_info(self) -> List[bytes]:
         start_index, _ = self.stream.find_index(self.start_key)
         last_delivered_index, _ = self.stream.find_index(self.last_delivered_key)
         last_ack_index, _ = self.stream.find_index(self.last_ack_key)
-        if start_index + (self.entries_read or 0) > len(self.stream):
-            lag = len(self.stream) - start_index - (self.entries_read or 0)
+        stream_len = len(self.stream)
+        entries_read = self.entries_read or 0
+        if start_index + entries_read > stream_len:
+            lag = stream_len - start_index - entries_read
         else:
-            lag = len(self.stream) - 1 - last_delivered_index
+            lag = stream_len - 1 - last_delivered_index
         res = {
             b"name": self.name,
             b"consumers": len(self.consumers),
@@ -139,30 +154,35 @@ class StreamGroup(object):
             b"entries-read": self.entries_read,
             b"lag": lag,
         }
-        return list(itertools.chain(*res.items()))  # type: ignore
+        return [x for kv in res.items() for x in kv]  # type: ignore
 
     def group_read(
         self, consumer_name: bytes, start_id: bytes, count: int, noack: bool
     ) -> List[List[Union[bytes, List[bytes]]]]:
         _time = current_time()
-        if consumer_name not in self.consumers:
-            self.consumers[consumer_name] = StreamConsumerInfo(consumer_name)
+        consumer = self.consumers.get(consumer_name)
+        if consumer is None:
+            consumer = self.consumers[consumer_name] = StreamConsumerInfo(consumer_name)
 
-        self.consumers[consumer_name].last_attempt = _time
+        consumer.last_attempt = _time
         if start_id == b">":
+            if len(self.stream) == 0 or self.stream.get_index(-1) <= self.last_delivered_key:
+                return []  # Nothing new was added since the last delivered entry
             start_key = self.last_delivered_key
         else:
             start_key = max(StreamEntryKey.parse_str(start_id), self.last_delivered_key)
         ids_read = self.stream.stream_read(start_key, count)
-        if not noack:
-            for k in ids_read:
+        res: List[List[Union[bytes, List[bytes]]]] = list()
+        for k in ids_read:
+            if not noack:
                 self.pel[k] = (consumer_name, _time)
+            res.append(self.stream.format_record(k))
         if len(ids_read) > 0:
             self.last_delivered_key = max(self.last_delivered_key, ids_read[-1])
             self.entries_read = (self.entries_read or 0) + len(ids_read)
-        self.consumers[consumer_name].last_success = _time
-        self.consumers[consumer_name].pending += len(ids_read)
-        return [self.stream.format_record(x) for x in ids_read]
+            consumer.last_success = _time
+            consumer.pending += len(ids_read)
+        return res
 
     def _calc_consumer_last_time(self) -> None:
         new_last_success_map = {k: min(v)[1] for k, v in itertools.groupby(self.pel.values(), key=itemgetter(0))}
@@ -196,31 +216,34 @@ class StreamGroup(object):
         consumer: Optional[bytes],
     ) -> List[List[bytes]]:
         _time = current_time()
-        relevant_ids = list(self.pel.keys())
-        if consumer is not None:
-            relevant_ids = [k for k in relevant_ids if self.pel[k][0] == consumer]
-        if idle is not None:
-            relevant_ids = [k for k in relevant_ids if self.pel[k][1] + idle < _time]
         if start is not None and end is not None:
-            relevant_ids = [
-                k
-                for k in relevant_ids
-                if (
-                    ((start.value < k) or (start.value == k and not start.exclusive))
-                    and ((end.value > k) or (end.value == k and not end.exclusive))
-                )
-            ]
-        if count is not None:
-            relevant_ids = sorted(relevant_ids)[:count]
-
-        return [[k.encode(), self.pel[k][0]] for k in relevant_ids]
+            if isinstance(start.value, AfterAny) or isinstance(end.value, BeforeAny):
+                return []
+            relevant_ids = self.pel.irange(
+                minimum=start.value if isinstance(start.value, StreamEntryKey) else None,
+                maximum=end.value if isinstance(end.value, StreamEntryKey) else None,
+                inclusive=(not start.exclusive, not end.exclusive),
+            )
+        else:
+            relevant_ids = iter(self.pel)
+        res: List[List[bytes]] = list()
+        for k in relevant_ids:
+            if count is not None and len(res) >= count:
+                break
+            consumer_name, read_time = self.pel[k]
+            if consumer is not None and consumer_name != consumer:
+                continue
+            if idle is not None and read_time + idle >= _time:
+                continue
+            res.append([k.encode(), consumer_name])
+        return res
 
     def pending_summary(self) -> List[Any]:
-        counter = Counter([self.pel[k][0] for k in self.pel])
+        counter = Counter([consumer_name for consumer_name, _ in self.pel.values()])
         data = [
             len(self.pel),
-            min(self.pel).encode() if len(self.pel) > 0 else None,
-            max(self.pel).encode() if len(self.pel) > 0 else None,
+            self.pel.peekitem(0)[0].encode() if len(self.pel) > 0 else None,
+            self.pel.peekitem(-1)[0].encode() if len(self.pel) > 0 else None,
             [[i, counter[i]] for i in counter],
         ]
         return data
@@ -266,28 +289,30 @@ class StreamGroup(object):
     def read_pel_msgs(self, min_idle_ms: int, start: bytes, count: int) -> List[StreamEntryKey]:
         start_key = StreamEntryKey.parse_str(start)
         curr_time = current_time()
-        msgs = sorted([k for k in self.pel if (curr_time - self.pel[k][1] >= min_idle_ms) and k >= start_key])
-        count = min(count, len(msgs))
-        return msgs[:count]
+        keys: List[StreamEntryKey] = list()
+        for k in self.pel.irange(minimum=start_key):
+            if len(keys) >= count:
+                break
+            if curr_time - self.pel[k][1] >= min_idle_ms:
+                keys.append(k)
+        return keys
 
 
 class XStream:
     """Class representing stream.
 
     The stream contains entries with keys (timestamp, sequence) and field->value pairs.
-    This implementation has them as a sorted list of tuples, the first value in the tuple
-    is the key (timestamp, sequence).
-
-    The structure of _values list is:
-    [
-       ((timestamp, sequence), [field1, value1, field2, value2, ...]),
-       ((timestamp, sequence), [field1, value1, field2, value2, ...]),
-    ]
+    This implementation keeps the keys in a sorted list, `_ids`, and maps each key to
+    its entry in `_values_dict`:
+    {
+       (timestamp, sequence): (b"timestamp-sequence", [field1, value1, field2, value2, ...]),
+       (timestamp, sequence): (b"timestamp-sequence", [field1, value1, field2, value2, ...]),
+    }
     """
 
     def __init__(self) -> None:
         self._ids: List[StreamEntryKey] = list()
-        self._values_dict: Dict[StreamEntryKey, List[bytes]] = dict()
+        self._values_dict: Dict[StreamEntryKey, StreamEntry] = dict()
         self._groups: Dict[bytes, StreamGroup] = dict()
         self._max_deleted_id = StreamEntryKey(0, 0)
         self._entries_added = 0
@@ -329,12 +354,12 @@ class XStream:
             b"last-entry": self.format_record(self._ids[-1]) if len(self._ids) > 0 else None,
             b"max-deleted-entry-id": self._max_deleted_id.encode(),
             b"entries-added": self._entries_added,
-            b"recorded-first-entry-id": self._ids[0].encode() if len(self._ids) > 0 else b"0-0",
+            b"recorded-first-entry-id": self._values_dict[self._ids[0]].encoded_key if len(self._ids) > 0 else b"0-0",
         }
         if full:
             res[b"entries"] = [self.format_record(i) for i in self._ids]
             res[b"groups"] = [g.group_info() for g in self._groups.values()]
-        return list(itertools.chain(*res.items()))
+        return [x for kv in res.items() for x in kv]
 
     def delete(self, lst: List[Union[str, bytes]]) -> int:
         """Delete items from stream
@@ -342,17 +367,26 @@ class XStream:
         :param lst: List of IDs to delete, in the form of `timestamp-sequence`.
         :returns: Number of items deleted
         """
-        res = 0
+        to_delete: Set[int] = set()
         for item in lst:
             ind, found = self.find_index_key_as_str(item)
             if found:
-                self._max_deleted_id = max(self._ids[ind], self._max_deleted_id)
-                del self._values_dict[self._ids[ind]]
+                to_delete.add(ind)
+        if not to_delete:
+            return 0
+        for ind in to_delete:
+            self._max_deleted_id = max(self._ids[ind], self._max_deleted_id)
+            del self._values_dict[self._ids[ind]]
+        if len(to_delete) <= _DELETE_REBUILD_THRESHOLD:
+            # Delete from the end so the remaining indices stay valid
+            for ind in sorted(to_delete, reverse=True):
                 del self._ids[ind]
-                res += 1
-        return res
+        else:
+            first = min(to_delete)
+            self._ids[first:] = [k for i, k in enumerate(self._ids[first:], first) if i not in to_delete]
+        return len(to_delete)
 
-    def add(self, fields: Sequence[bytes], entry_key: str = "*") -> Union[None, bytes]:
+    def add(self, fields: Sequence[bytes], entry_key: Union[str, bytes] = b"*") -> Union[None, bytes]:
         """Add entry to a stream.
 
         If the entry_key cannot be added (because its timestamp is before the last entry, etc.),
@@ -371,33 +405,32 @@ class XStream:
         :raises AssertionError: If len(fields) is not even.
         """
         assert len(fields) % 2 == 0
-        if isinstance(entry_key, bytes):
-            entry_key = entry_key.decode()
-
-        if entry_key is None or entry_key == "*":
-            ts, seq = int(1000 * time.time()), 0
-            if len(self._ids) > 0 and self._ids[-1].ts == ts and self._ids[-1].seq >= seq:
-                seq = self._ids[-1].seq + 1
+        if isinstance(entry_key, str):
+            entry_key = entry_key.encode()
+
+        last_key = self._ids[-1] if len(self._ids) > 0 else None
+        if entry_key is None or entry_key == b"*":
+            ts, seq = current_time(), 0
+            if last_key is not None and last_key.ts == ts:
+                seq = last_key.seq + 1
             ts_seq = StreamEntryKey(ts, seq)
-        elif entry_key[-1] == "*":  # entry_key has `timestamp-*` structure
-            split = entry_key.split("-")
+        elif entry_key.endswith(b"*"):  # entry_key has `timestamp-*` structure
+            split = entry_key.split(b"-")
             if len(split) != 2:
                 return None
-            ts, seq = int(split[0]), split[1]  # type: ignore
-            if len(self._ids) > 0 and ts == self._ids[-1].ts:
-                seq = self._ids[-1].seq + 1
-            else:
-                seq = 0
+            ts = int(split[0])
+            seq = last_key.seq + 1 if last_key is not None and ts == last_key.ts else 0
             ts_seq = StreamEntryKey(ts, seq)
         else:
             ts_seq = StreamEntryKey.parse_str(entry_key)
 
-        if len(self._ids) > 0 and self._ids[-1] > ts_seq:
+        if last_key is not None and last_key >= ts_seq:
             return None
         self._ids.append(ts_seq)
-        self._values_dict[ts_seq] = list(fields)
+        encoded_key = ts_seq.encode()
+        self._values_dict[ts_seq] = StreamEntry(encoded_key, list(fields))
         self._entries_added += 1
-        return ts_seq.encode()
+        return encoded_key
 
     def __bool__(self):
         return True
@@ -405,15 +438,11 @@ class XStream:
     def __len__(self) -> int:
         return len(self._ids)
 
-    def __iter__(self) -> Generator[List[Union[bytes, List[bytes]]], Any, None]:
-        def gen() -> Generator[List[Union[bytes, List[bytes]]], Any, None]:
-            for k in self._ids:
-                yield self.format_record(k)
-
-        return gen()
+    def __iter__(self) -> Iterator[List[Union[bytes, List[bytes]]]]:
+        return (self.format_record(k) for k in self._ids)
 
-    def __getitem__(self, key: bytes) -> Union[StreamEntryKey, List[bytes]]:
-        return self._values_dict[StreamEntryKey.parse_str(key)]
+    def __getitem__(self, key: bytes) -> List[bytes]:
+        return self._values_dict[StreamEntryKey.parse_str(key)].fields
 
     def get_index(self, ind: int) -> StreamEntryKey:
         return self._ids[ind]
@@ -465,8 +494,8 @@ class XStream:
 
         :param max_length: Max length of the resulting stream after trimming (number of last values to keep)
         :param start_entry_key: Min entry-key to keep, cannot be given together with max_length.
-        :param limit: Number of entries to keep from minid.
-        :returns: The resulting stream after trimming.
+        :param limit: Max number of entries to remove, 0 or None for no limit.
+        :returns: The number of entries removed.
         :raises ValueError: When both max_length and start_entry_key are passed.
         """
         if max_length is not None and start_entry_key is not None:
@@ -479,9 +508,9 @@ class XStream:
             start_ind = ind
         res: int = min(max(start_ind or 0, 0), limit or sys.maxsize)
 
-        remove_keys, self._ids = self._ids[:res], self._ids[res:]
-        for k in remove_keys:
+        for k in itertools.islice(self._ids, res):
             del self._values_dict[k]
+        del self._ids[:res]
         return res
 
     def irange(self, start: StreamRangeTest, stop: StreamRangeTest, reverse: bool = False) -> List[Any]:
@@ -505,23 +534,28 @@ class XStream:
 
         start_ind = _find_index(start)
         stop_ind = _find_index(stop, from_left=False)
-        matches = map(lambda x: self.format_record(self._ids[x]), range(start_ind, stop_ind))
+        matches = [self.format_record(k) for k in self._ids[start_ind:stop_ind]]
         if reverse:
-            return list(reversed(tuple(matches)))
-        return list(matches)
+            matches.reverse()
+        return matches
 
     def last_item_key(self) -> bytes:
-        return self._ids[-1].encode() if len(self._ids) > 0 else "0-0".encode()
+        return self._values_dict[self._ids[-1]].encoded_key if len(self._ids) > 0 else b"0-0"
 
     def stream_read(self, start_key: StreamEntryKey, count: Union[int, None]) -> List[StreamEntryKey]:
+        n = len(self._ids)
         start_ind, found = self.find_index(start_key)
         if found:
             start_ind += 1
-        if start_ind >= len(self):
+        if start_ind >= n:
             return []
-        end_ind = len(self) if count is None or start_ind + count >= len(self) else start_ind + count
+        end_ind = n if count is None else min(start_ind + count, n)
         return self._ids[start_ind:end_ind]
 
     def format_record(self, key: StreamEntryKey) -> List[Union[bytes, List[bytes]]]:
-        results = self._values_dict[key]
-        return [key.encode(), results]
+        """Returns `[encoded key, fields]` for the entry.
+
+        The fields list is the one stored in the stream, not a copy, callers must not mutate it.
+        """
+        entry = self._values_dict[key]
+        return [entry.encoded_key, entry.fields]
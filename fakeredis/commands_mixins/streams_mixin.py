@@ -32,7 +32,12 @@ class StreamsCommandsMixin:
         stream = key.value if key.value is not None else XStream()
         if self.version < (7,) and entry_key != b"*" and not StreamRangeTest.valid_key(entry_key):
             raise SimpleError(msgs.XADD_INVALID_ID)
-        res: Optional[bytes] = stream.add(elements, entry_key=entry_key)
+        if minid is not None and not StreamRangeTest.valid_key(minid):
+            raise SimpleError(msgs.XADD_INVALID_ID)
+        try:
+            res: Optional[bytes] = stream.add(elements, entry_key=entry_key)
+        except ValueError:
+            raise SimpleError(msgs.XADD_INVALID_ID)
         if res is None:
             if not StreamRangeTest.valid_key(left_args[0]):
                 raise SimpleError(msgs.XADD_INVALID_ID)
@@ -49,6 +54,8 @@ class StreamsCommandsMixin:
             raise SimpleError(msgs.SYNTAX_ERROR_MSG)
         if maxlen is None and minid is None:
             raise SimpleError(msgs.SYNTAX_ERROR_MSG)
+        if minid is not None and not StreamRangeTest.valid_key(minid):
+            raise SimpleError(msgs.XADD_INVALID_ID)
         stream = key.value or XStream()
         res = stream.trim(max_length=maxlen, start_entry_key=minid, limit=limit)
         key.update(stream)
@@ -112,6 +119,9 @@ class StreamsCommandsMixin:
             raise SimpleError(msgs.SYNTAX_ERROR_MSG)
         left_args = left_args[1:]
         num_streams = int(len(left_args) / 2)
+        for start_id in left_args[num_streams:]:
+            if start_id != b">" and not StreamRangeTest.valid_key(start_id):
+                raise SimpleError(msgs.XADD_INVALID_ID)
 
         # List of (group, stream_name, stream start-id)
         group_params: List[Tuple[StreamGroup, bytes, bytes]] = list()
@@ -147,6 +157,8 @@ class StreamsCommandsMixin:
     def xdel(self, key: CommandItem, *args: bytes) -> int:
         if len(args) == 0:
             raise SimpleError(msgs.WRONG_ARGS_MSG6.format("xdel"))
+        if not all(arg == b"$" or StreamRangeTest.valid_key(arg) for arg in args):
+            raise SimpleError(msgs.XADD_INVALID_ID)
         res: int = key.value.delete(args)
         return res
 
@@ -200,6 +212,8 @@ class StreamsCommandsMixin:
             raise SimpleError(msgs.XGROUP_KEY_NOT_FOUND_MSG)
         if key.value.group_get(group_name) is not None:
             raise SimpleError(msgs.XGROUP_BUSYGROUP)
+        if start_key != b"$" and not StreamRangeTest.valid_key(start_key):
+            raise SimpleError(msgs.XADD_INVALID_ID)
         key.value.group_add(group_name, start_key, entries_read)
         key.updated()
         return OK
@@ -212,6 +226,8 @@ class StreamsCommandsMixin:
         group = key.value.group_get(group_name)
         if not group:
             raise SimpleError(msgs.XGROUP_GROUP_NOT_FOUND_MSG.format(group_name.decode(), key))
+        if start_key != b"$" and not StreamRangeTest.valid_key(start_key):
+            raise SimpleError(msgs.XADD_INVALID_ID)
         group.set_id(start_key, entries_read)
         return OK
 
@@ -297,6 +313,8 @@ class StreamsCommandsMixin:
     ) -> List[Union[bytes, List[Union[bytes, List[Tuple[bytes, List[bytes]]]]]]]:
         (count, justid), _ = extract_args(args, ("+count", "justid"))
         count = count or 100
+        if not StreamRangeTest.valid_key(start):
+            raise SimpleError(msgs.XADD_INVALID_ID)
         stream = key.value
         if stream is None:
             raise SimpleError(msgs.XGROUP_KEY_NOT_FOUND_MSG)
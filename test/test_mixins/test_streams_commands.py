@@ -6,7 +6,7 @@ import pytest
 import redis
 
 from fakeredis import _msgs as msgs
-from fakeredis._stream import XStream, StreamRangeTest
+from fakeredis._stream import XStream, StreamRangeTest, StreamEntryKey
 from test import testtools
 
 
@@ -64,6 +64,22 @@ def test_xstream():
     assert len(stream) == 0
 
 
+@pytest.mark.fake
+@pytest.mark.parametrize("n_deleted", [3, 600])
+def test_xstream_delete(n_deleted: int):
+    stream = XStream()
+    keys = [stream.add([b"i", b"%d" % i], f"{i}-0") for i in range(1, 2001)]
+    deleted = keys[100 : 100 + 2 * n_deleted : 2]
+
+    # duplicate and missing ids are not counted
+    assert stream.delete(deleted + deleted[:1] + [b"5000-0"]) == n_deleted
+    remaining = [k for k in keys if k not in set(deleted)]
+    assert len(stream) == len(remaining)
+    assert [record[0] for record in stream] == remaining
+    assert all(k not in stream for k in map(StreamEntryKey.parse_str, deleted))
+    assert stream.stream_info(False)[9] == deleted[-1]  # max-deleted-entry-id
+
+
 def test_xadd_redis__green(r: redis.Redis):
     stream = "stream"
     before = int(1000 * time.time())
@@ -87,6 +103,44 @@ def test_xadd_redis__green(r: redis.Redis):
         r.xadd(stream, {"add": "more"}, id=f"{ts1}-1")
 
 
+def test_xadd_equal_id(r: redis.Redis):
+    stream = "stream"
+    r.xadd(stream, {"some": "other"}, id="1-1")
+    with pytest.raises(redis.ResponseError) as ex:
+        r.xadd(stream, {"add": "more"}, id="1-1")
+    assert ex.value.args[0] == msgs.XADD_ID_LOWER_THAN_LAST[4:]
+    assert r.xlen(stream) == 1
+    assert r.xrange(stream) == [(b"1-1", {b"some": b"other"})]
+
+
+def test_stream_commands_invalid_id(r: redis.Redis):
+    stream = "stream"
+    r.xadd(stream, {"some": "other"}, id="1-1")
+    with pytest.raises(redis.ResponseError, match=msgs.XADD_INVALID_ID[4:]):
+        r.xadd(stream, {"add": "more"}, id="5-2-3")
+    with pytest.raises(redis.ResponseError, match=msgs.XADD_INVALID_ID[4:]):
+        r.xdel(stream, "1-1", "1-2-3")
+    with pytest.raises(redis.ResponseError, match=msgs.XADD_INVALID_ID[4:]):
+        r.xrange(stream, min="1-2-3")
+    with pytest.raises(redis.ResponseError, match=msgs.XADD_INVALID_ID[4:]):
+        r.xtrim(stream, minid="1-2-3", approximate=False)
+    assert r.xrange(stream) == [(b"1-1", {b"some": b"other"})]
+
+    r.xgroup_create(stream, "group", 0)
+    with pytest.raises(redis.ResponseError, match=msgs.XADD_INVALID_ID[4:]):
+        r.xgroup_create(stream, "group2", "1-2-3")
+    with pytest.raises(redis.ResponseError, match=msgs.XADD_INVALID_ID[4:]):
+        r.xgroup_setid(stream, "group", "1-2-3")
+    with pytest.raises(redis.ResponseError, match=msgs.XADD_INVALID_ID[4:]):
+        r.xreadgroup("group", "consumer", {stream: "1-2-3"})
+    with pytest.raises(redis.ResponseError, match=msgs.XADD_INVALID_ID[4:]):
+        r.xreadgroup("group", "consumer", {stream: "1-2-3"}, block=10)
+    with pytest.raises(redis.ResponseError, match=msgs.XADD_INVALID_ID[4:]):
+        r.xautoclaim(stream, "group", "consumer", 0, "1-2-3")
+    assert r.xinfo_groups(stream)[0]["name"] == b"group"
+    assert len(r.xinfo_groups(stream)) == 1
+
+
 @pytest.mark.min_server("7")
 def test_xadd_redis7(r: redis.Redis):  # Using ts-*
     stream = "stream"
@@ -170,6 +224,18 @@ def test_xtrim_minlen_and_length_args(r: redis.Redis):
     assert r.xtrim(stream, approximate=False, minid=m3) == 3
 
 
+@testtools.fake_only
+def test_xtrim_limit(r: redis.Redis):
+    stream = "stream"
+    id_list = add_items(r, stream, 6)
+
+    # limit caps the number of entries removed, not the resulting length
+    assert testtools.raw_command(r, "xtrim", stream, "maxlen", "~", "2", "limit", "3") == 3
+    assert get_ids(r.xrange(stream)) == id_list[3:]
+    assert testtools.raw_command(r, "xtrim", stream, "minid", "~", id_list[5], "limit", "1") == 1
+    assert get_ids(r.xrange(stream)) == id_list[4:]
+
+
 def test_xadd_nomkstream(r: redis.Redis):
     r.xadd("stream2", {"some": "other"}, nomkstream=True)
     assert r.xlen("stream2") == 0
@@ -327,6 +393,18 @@ def test_xdel(r: redis.Redis):
     assert r.xdel("non-existing-key", "1-1") == 0
 
 
+@pytest.mark.min_server("7")
+def test_xdel_multiple_ids(r: redis.Redis):
+    stream = "stream"
+    ids = [r.xadd(stream, {"i": i}, id=f"{i}-0") for i in range(1, 6)]
+
+    # duplicate and missing ids are not counted
+    assert r.xdel(stream, ids[3], ids[1], ids[3], "100-0") == 2
+    assert r.xlen(stream) == 3
+    assert [k for k, _ in r.xrange(stream)] == [ids[0], ids[2], ids[4]]
+    assert r.xinfo_stream(stream)["max-deleted-entry-id"] == ids[3]
+
+
 def test_xgroup_destroy(r: redis.Redis):
     stream = "stream"
     group = "group"
@@ -448,6 +526,33 @@ def test_xinfo_consumers(r: redis.Redis):
     assert info == expected
 
 
+def test_xreadgroup_nothing_new(r: redis.Redis):
+    stream, group, consumer1, consumer2 = "stream", "group", "consumer1", "consumer2"
+    m1 = r.xadd(stream, {"foo": "bar"})
+    r.xgroup_create(stream, group, 0)
+    assert r.xreadgroup(group, consumer1, streams={stream: ">"}) == [[stream.encode(), [(m1, {b"foo": b"bar"})]]]
+
+    # polling with no new entries returns nothing, but still registers the consumer
+    assert r.xreadgroup(group, consumer1, streams={stream: ">"}) == []
+    assert r.xreadgroup(group, consumer2, streams={stream: ">"}) == []
+    info = {c["name"]: c["pending"] for c in r.xinfo_consumers(stream, group)}
+    assert info == {consumer1.encode(): 1, consumer2.encode(): 0}
+
+    # empty polls reset the idle time, but not the time since the last successful read
+    time.sleep(0.1)
+    assert r.xreadgroup(group, consumer1, streams={stream: ">"}) == []
+    time.sleep(0.1)
+    assert r.xreadgroup(group, consumer1, streams={stream: ">"}) == []
+    info = r.xinfo_consumers(stream, group)[0]
+    assert info["name"] == consumer1.encode()
+    assert info["idle"] < 100
+    if "inactive" in info:  # Added in redis 7.2
+        assert info["inactive"] >= 200
+
+    m2 = r.xadd(stream, {"bing": "baz"})
+    assert r.xreadgroup(group, consumer2, streams={stream: ">"}) == [[stream.encode(), [(m2, {b"bing": b"baz"})]]]
+
+
 def test_xreadgroup(r: redis.Redis):
     stream, group, consumer = "stream", "group", "consumer1"
     with pytest.raises(redis.exceptions.ResponseError):
@@ -646,6 +751,31 @@ def test_xpending_range(r: redis.Redis):
     assert response[0]["consumer"] == consumer1.encode()
 
 
+def test_xpending_range_bounds(r: redis.Redis):
+    stream, group, consumer1, consumer2 = "stream", "group", "consumer1", "consumer2"
+    ids = [r.xadd(stream, {"i": i}, id=f"{i}-0") for i in range(1, 6)]
+    r.xgroup_create(stream, group, 0)
+    r.xreadgroup(group, consumer1, streams={stream: ">"}, count=2)
+    r.xreadgroup(group, consumer2, streams={stream: ">"}, count=3)
+
+    response = r.xpending_range(stream, group, min=ids[1], max=ids[3], count=5)
+    assert [x["message_id"] for x in response] == ids[1:4]
+    response = r.xpending_range(stream, group, min=f"({ids[1].decode()}", max="+", count=2)
+    assert [x["message_id"] for x in response] == ids[2:4]
+    response = r.xpending_range(stream, group, min="-", max="+", count=2, consumername=consumer2)
+    assert [x["message_id"] for x in response] == ids[2:4]
+
+    # inverted bounds match nothing
+    assert r.xpending_range(stream, group, min="+", max="-", count=10) == []
+    assert r.xpending_range(stream, group, min="3", max="-", count=10) == []
+    assert r.xpending_range(stream, group, min="+", max="2", count=10) == []
+    assert r.xpending_range(stream, group, min=ids[3], max=ids[1], count=10) == []
+
+    summary = r.xpending(stream, group)
+    assert summary["min"] == ids[0]
+    assert summary["max"] == ids[4]
+
+
 def test_xpending_range_idle(r: redis.Redis):
     stream, group, consumer1, consumer2 = "stream", "group", "consumer1", "consumer2"
     r.xadd(stream, {"foo": "bar"})